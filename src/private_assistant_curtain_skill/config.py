@@ -0,0 +1,29 @@
+import pathlib
+from typing import Literal
+
+from private_assistant_commons import skill_config
+from pydantic import field_validator
+
+CommandName = Literal["open", "close", "set"]
+
+# Open and close are idempotent, so a lost message is harmless and QoS 0 skips the PUBACK wait
+DEFAULT_COMMAND_QOS: dict[CommandName, Literal[0, 1, 2]] = {"open": 0, "close": 0, "set": 1}
+
+
+class CurtainSkillConfig(skill_config.SkillConfig):
+    # Entries override the defaults per command, commands that are left out keep their default QoS
+    command_qos: dict[CommandName, Literal[0, 1, 2]] = DEFAULT_COMMAND_QOS
+    # Seconds after which the device cache is reloaded from the database, None keeps it until restart
+    device_cache_ttl: float | None = None
+    # An empty cache is reloaded after at most this many seconds, so curtains added after startup are picked up
+    # without querying the database on every request
+    empty_device_cache_ttl: float = 30.0
+    # Directory for compiled template bytecode, only useful on a persistent volume, None disables the cache
+    template_bytecode_cache_dir: pathlib.Path | None = None
+
+    @field_validator("command_qos")
+    @classmethod
+    def merge_default_command_qos(
+        cls, value: dict[CommandName, Literal[0, 1, 2]]
+    ) -> dict[CommandName, Literal[0, 1, 2]]:
+        return {**DEFAULT_COMMAND_QOS, **value}
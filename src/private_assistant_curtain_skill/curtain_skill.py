@@ -1,21 +1,31 @@
 import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from enum import Enum
 
 import aiomqtt
 import jinja2
 import private_assistant_commons as commons
-from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from private_assistant_curtain_skill.models import CurtainSkillDevice
+from private_assistant_curtain_skill.config import CurtainSkillConfig
+from private_assistant_curtain_skill.models import DEFAULT_PAYLOAD_SET_TEMPLATE, CurtainSkillDevice
 
+ANSWER_CACHE_SIZE = 128
+MISSING_POSITION_ANSWER = "Sorry, you did not say which position to set the curtains to."
 
-class Parameters(BaseModel):
-    position: int = 0
-    targets: list[CurtainSkillDevice] = []
-    rooms: list[str] = []
+# Shared environment for compiling the device payload templates, which are JSON and must not be autoescaped
+PAYLOAD_TEMPLATE_ENV = jinja2.Environment(autoescape=False)
+
+
+@dataclass(slots=True)
+class Parameters:
+    position: int | None = None
+    targets: list[CurtainSkillDevice] = field(default_factory=list)
+    rooms: list[str] = field(default_factory=list)
 
 
 class Action(Enum):
@@ -26,27 +36,48 @@ class Action(Enum):
 
     @classmethod
     def find_matching_action(cls, verbs: list):
-        for action in cls:
-            if action.value in verbs:
+        for verb in verbs:
+            action = VERB_TO_ACTION.get(verb)
+            if action is not None:
                 return action
         return None
 
 
+VERB_TO_ACTION: dict[str, Action] = {action.value: action for action in Action}
+TARGETED_ACTIONS: frozenset[Action] = frozenset({Action.OPEN, Action.CLOSE, Action.SET})
+
+
+def encode_static_payloads(device: CurtainSkillDevice) -> dict[Action, bytes]:
+    return {Action.OPEN: device.payload_open.encode(), Action.CLOSE: device.payload_close.encode()}
+
+
 class CurtainSkill(commons.BaseSkill):
     def __init__(
         self,
-        config_obj: commons.SkillConfig,
+        config_obj: CurtainSkillConfig,
         mqtt_client: aiomqtt.Client,
         db_engine: AsyncEngine,
         template_env: jinja2.Environment,
         task_group: asyncio.TaskGroup,
         logger,
+        ready: asyncio.Event | None = None,
     ) -> None:
         super().__init__(config_obj, mqtt_client, task_group, logger=logger)
         self.db_engine = db_engine
         self.template_env = template_env
+        self.ready = ready
         self._device_cache: dict[str, list[CurtainSkillDevice]] = {}
+        self._device_cache_loaded_at: float | None = None
+        # Serialises reloads so that concurrent requests on an expired cache share a single database query
+        self._device_cache_lock = asyncio.Lock()
+        self.device_cache_ttl = config_obj.device_cache_ttl
+        self.empty_device_cache_ttl = config_obj.empty_device_cache_ttl
         self.action_to_answer: dict[Action, jinja2.Template] = {}
+        self._answer_cache: OrderedDict[tuple[Action, tuple[str, ...], bool, int | None], str] = OrderedDict()
+        self._payload_set_templates: dict[str, jinja2.Template] = {}
+        self._static_payloads: dict[int, dict[Action, bytes]] = {}
+        self.supported_nouns: frozenset[str] = frozenset({"curtain", "curtains"})
+        self.command_qos: dict[Action, int] = {Action(value): qos for value, qos in config_obj.command_qos.items()}
 
         # Preload templates
         try:
@@ -58,40 +89,85 @@ class CurtainSkill(commons.BaseSkill):
         except jinja2.TemplateNotFound as e:
             self.logger.error("Failed to load template: %s", e)
 
+    def device_cache_is_fresh(self) -> bool:
+        """Check whether the device cache was loaded and has not outlived the configured TTL."""
+        if self._device_cache_loaded_at is None:
+            return False
+        ttl = self.device_cache_ttl
+        if not self._device_cache and (ttl is None or self.empty_device_cache_ttl < ttl):
+            ttl = self.empty_device_cache_ttl
+        return ttl is None or time.monotonic() - self._device_cache_loaded_at < ttl
+
     async def load_device_cache(self) -> None:
         """Asynchronously load devices into the cache."""
-        if not self._device_cache:
+        if self.device_cache_is_fresh():
+            return
+        async with self._device_cache_lock:
+            # Another request may have reloaded the cache while this one waited for the lock
+            if self.device_cache_is_fresh():
+                return
             self.logger.debug("Loading devices into cache asynchronously.")
+            # Build the new cache and payloads separately so concurrent requests never see a partially loaded one
+            device_cache: dict[str, list[CurtainSkillDevice]] = {}
+            static_payloads: dict[int, dict[Action, bytes]] = {}
             async with AsyncSession(self.db_engine) as session:
                 statement = select(CurtainSkillDevice)
-                result = await session.exec(statement)
-                devices = result.all()
-                for device in devices:
+                # Stream the rows so the cache is filled while they arrive instead of after a full fetch
+                devices = await session.stream_scalars(statement)
+                async for device in devices:
+                    device_cache.setdefault(device.room, []).append(device)
                     try:
-                        device.model_validate(device)
-                        if device.room not in self._device_cache:
-                            self._device_cache[device.room] = []
-                        self._device_cache[device.room].append(device)
-                    except ValidationError as e:
-                        self.logger.error("Validation error loading device into cache: %s", e)
+                        self.get_payload_set_template(device)
+                    except jinja2.TemplateSyntaxError as e:
+                        # Only set commands need the template, open and close keep working for this device
+                        self.logger.error("Invalid payload_set_template for device %s: %s", device.topic, e)
+                    if device.id is not None:
+                        static_payloads[device.id] = encode_static_payloads(device)
+            self._device_cache = device_cache
+            self._static_payloads = static_payloads
+            self._device_cache_loaded_at = time.monotonic()
+
+    def get_payload_set_template(self, device: CurtainSkillDevice) -> jinja2.Template:
+        """Return the compiled payload_set template of a device, compiling it only on first use."""
+        template = self._payload_set_templates.get(device.payload_set_template)
+        if template is None:
+            template = PAYLOAD_TEMPLATE_ENV.from_string(device.payload_set_template)
+            self._payload_set_templates[device.payload_set_template] = template
+        return template
+
+    def get_static_payloads(self, device: CurtainSkillDevice) -> dict[Action, bytes]:
+        """Return the encoded open/close payloads of a device, prebuilt for every device in the cache."""
+        payloads = self._static_payloads.get(device.id) if device.id is not None else None
+        if payloads is None:
+            # Only the cache load fills the table, a device held across a reload must not store stale payloads
+            payloads = encode_static_payloads(device)
+        return payloads
 
     async def get_devices(self, rooms: list[str]) -> list[CurtainSkillDevice]:
         """Return devices for a specific room, using async cache loading."""
-        if not self._device_cache:
+        if not self.device_cache_is_fresh():
             await self.load_device_cache()
         self.logger.info("Fetching devices for room: %s", rooms)
 
         # Gather devices from all specified rooms
-        devices = []
+        devices: list[CurtainSkillDevice] = []
         for room in rooms:
-            devices.extend(self._device_cache.get(room, []))
+            devices.extend(self._device_cache.get(room, ()))
         return devices
 
-    async def skill_preparations(self):
-        return await super().skill_preparations()
+    async def skill_preparations(self) -> None:
+        # Warm the device cache before the first request so it does not wait on the database
+        try:
+            await self.load_device_cache()
+        except Exception as e:
+            # The handler only retries MQTT errors, anything else would end the skill, so the first request retries
+            self.logger.error("Failed to preload the device cache: %s", e, exc_info=e)
+        # Subscriptions are acknowledged before the preparations run, so the skill can take requests now
+        if self.ready is not None:
+            self.ready.set()
 
     async def calculate_certainty(self, intent_analysis_result: commons.IntentAnalysisResult) -> float:
-        if "curtain" in intent_analysis_result.nouns or "curtains" in intent_analysis_result.nouns:
+        if any(noun.casefold() in self.supported_nouns for noun in intent_analysis_result.nouns):
             self.logger.debug("Curtain noun detected, certainty set to 1.0.")
             return 1.0
         self.logger.debug("No curtain noun detected, certainty set to 0.")
@@ -101,14 +177,21 @@ class CurtainSkill(commons.BaseSkill):
         parameters = Parameters()
         parameters.rooms = intent_analysis_result.rooms or [intent_analysis_result.client_request.room]
         devices = await self.get_devices(parameters.rooms)
-        if action in [Action.OPEN, Action.CLOSE, Action.SET]:
-            parameters.targets = list(devices)
+        if action in TARGETED_ACTIONS:
+            parameters.targets = devices
         if action == Action.SET and intent_analysis_result.numbers:
             parameters.position = intent_analysis_result.numbers[0].number_token
         self.logger.debug("Parameters found for action %s: %s", action, parameters)
         return parameters
 
     def get_answer(self, action: Action, parameters: Parameters) -> str:
+        # The answer templates only depend on the rooms, the position and whether targets were found
+        cache_key = (action, tuple(parameters.rooms), bool(parameters.targets), parameters.position)
+        answer = self._answer_cache.get(cache_key)
+        if answer is not None:
+            self._answer_cache.move_to_end(cache_key)
+            return answer
+
         template = self.action_to_answer.get(action)
         if template:
             answer = template.render(
@@ -116,28 +199,58 @@ class CurtainSkill(commons.BaseSkill):
                 parameters=parameters,
             )
             self.logger.debug("Generated answer using template for action %s.", action)
+            self._answer_cache[cache_key] = answer
+            if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+                self._answer_cache.popitem(last=False)
             return answer
         self.logger.error("No template found for action %s.", action)
         return "Sorry, I couldn't process your request."
 
     async def send_mqtt_command(self, action: Action, parameters: Parameters) -> None:
-        """Send the MQTT command asynchronously."""
+        """Send the MQTT command to all target devices concurrently."""
+        # Ordered set of (topic, payload); curtains sharing a group topic only need a single publish
+        publishes: dict[tuple[str, bytes], None] = {}
+        # Devices sharing a payload_set_template get the same rendered and encoded payload
+        set_payloads: dict[str, bytes] = {}
         for device in parameters.targets:
-            if action == Action.OPEN:
-                payload = device.payload_open
-            elif action == Action.CLOSE:
-                payload = device.payload_close
-            elif action == Action.SET:
-                payload = jinja2.Template(device.payload_set_template).render(position=parameters.position)
+            if action == Action.SET:
+                payload = set_payloads.get(device.payload_set_template)
+                if payload is None:
+                    if parameters.position is not None and device.payload_set_template == DEFAULT_PAYLOAD_SET_TEMPLATE:
+                        # The stock template is a single integer field, bytes formatting skips Jinja entirely
+                        payload = b'{"position": %d}' % parameters.position
+                    else:
+                        try:
+                            template = self.get_payload_set_template(device)
+                        except jinja2.TemplateSyntaxError as e:
+                            self.logger.error("Cannot set device %s, invalid payload_set_template: %s", device.topic, e)
+                            continue
+                        payload = template.render(position=parameters.position).encode()
+                    set_payloads[device.payload_set_template] = payload
             else:
-                self.logger.error("Unknown action: %s", action)
+                static_payload = self.get_static_payloads(device).get(action)
+                if static_payload is None:
+                    self.logger.error("Unknown action: %s", action)
+                    continue
+                payload = static_payload
+
+            if (device.topic, payload) in publishes:
                 continue
+            self.logger.debug("Sending payload %s to topic %s via MQTT.", payload, device.topic)
+            publishes[(device.topic, payload)] = None
 
-            self.logger.info("Sending payload %s to topic %s via MQTT.", payload, device.topic)
-            try:
-                await self.mqtt_client.publish(device.topic, payload, qos=1)
-            except Exception as e:
-                self.logger.error("Failed to send MQTT message to topic %s: %s", device.topic, e, exc_info=True)
+        # Nothing to publish, e.g. for actions without a device payload, which also have no QoS configured
+        if not publishes:
+            return
+        # Publish in parallel so that the PUBACK round trips of all devices overlap
+        qos = self.command_qos[action]
+        results = await asyncio.gather(
+            *(self.mqtt_client.publish(topic, payload, qos=qos) for topic, payload in publishes),
+            return_exceptions=True,
+        )
+        for (topic, _), result in zip(publishes, results, strict=True):
+            if isinstance(result, Exception):
+                self.logger.error("Failed to send MQTT message to topic %s: %s", topic, result, exc_info=result)
 
     async def process_request(self, intent_analysis_result: commons.IntentAnalysisResult) -> None:
         action = Action.find_matching_action(intent_analysis_result.verbs)
@@ -146,10 +259,16 @@ class CurtainSkill(commons.BaseSkill):
             return
 
         parameters = await self.find_parameters(action, intent_analysis_result)
+        if action == Action.SET and parameters.position is None:
+            self.logger.warning("No position found for action %s.", action)
+            self.add_task(
+                self.send_response(MISSING_POSITION_ANSWER, client_request=intent_analysis_result.client_request)
+            )
+            return
         if parameters.targets:
             answer = self.get_answer(action, parameters)
             self.add_task(self.send_response(answer, client_request=intent_analysis_result.client_request))
-            if action not in [Action.HELP]:
+            if action is not Action.HELP:
                 self.add_task(self.send_mqtt_command(action, parameters))
         else:
             self.logger.error("No targets found for action %s.", action)
@@ -5,10 +5,11 @@ from typing import Annotated
 import jinja2
 import typer
 from private_assistant_commons import mqtt_connection_handler, skill_config, skill_logger
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
 
-from private_assistant_curtain_skill import curtain_skill
+from private_assistant_curtain_skill import config, curtain_skill
 
 app = typer.Typer()
 
@@ -18,29 +19,64 @@ def main(config_path: Annotated[pathlib.Path, typer.Argument(envvar="PRIVATE_ASS
     asyncio.run(start_skill(config_path))
 
 
+def create_skill_engine(
+    url: str,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_recycle: int = 1800,
+    pool_timeout: int = 30,
+) -> AsyncEngine:
+    """Create the async database engine with a pooled, health-checked set of connections."""
+    return create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout,
+    )
+
+
+def make_template_env(bytecode_cache_dir: pathlib.Path | None = None) -> jinja2.Environment:
+    """Create the template environment with reloading disabled, caching compiled templates in the given directory."""
+    if bytecode_cache_dir is not None:
+        # Jinja only writes into the directory, a missing one would fail the first template load
+        bytecode_cache_dir.mkdir(parents=True, exist_ok=True)
+    return jinja2.Environment(
+        loader=jinja2.PackageLoader(
+            "private_assistant_curtain_skill",
+            "templates",
+        ),
+        auto_reload=False,
+        bytecode_cache=(
+            jinja2.FileSystemBytecodeCache(directory=str(bytecode_cache_dir))
+            if bytecode_cache_dir is not None
+            else None
+        ),
+    )
+
+
 async def start_skill(
     config_path: pathlib.Path,
+    ready: asyncio.Event | None = None,
 ):
+    """Run the skill until cancelled, setting ready once it is subscribed and its device cache is loaded."""
     # Set up logger early on
     logger = skill_logger.SkillLogger.get_logger("Private Assistant CurtainSkill")
 
     # Load configuration
-    config_obj = skill_config.load_config(config_path, skill_config.SkillConfig)
+    config_obj = skill_config.load_config(config_path, config.CurtainSkillConfig)
 
     # Create an async database engine
-    db_engine_async = create_async_engine(skill_config.PostgresConfig.from_env().connection_string_async)
+    db_engine_async = create_skill_engine(skill_config.PostgresConfig.from_env().connection_string_async)
 
     # Create tables asynchronously
     async with db_engine_async.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
 
     # Set up Jinja2 template environment
-    template_env = jinja2.Environment(
-        loader=jinja2.PackageLoader(
-            "private_assistant_curtain_skill",
-            "templates",
-        )
-    )
+    template_env = make_template_env(config_obj.template_bytecode_cache_dir)
 
     # Start the skill using the async MQTT connection handler
     await mqtt_connection_handler.mqtt_connection_handler(
@@ -50,6 +86,7 @@ async def start_skill(
         logger=logger,
         template_env=template_env,
         db_engine=db_engine_async,
+        ready=ready,
     )
 
 
@@ -4,12 +4,18 @@ from pydantic import field_validator
 from sqlmodel import Field, SQLModel
 
 # Define a regex pattern for a valid MQTT topic
-MQTT_TOPIC_REGEX = re.compile(r"[\$#\+\s\0-\31]+")
+MQTT_TOPIC_REGEX = re.compile(r"[\x00-\x1f$#+\s]")
+
+DEFAULT_PAYLOAD_SET_TEMPLATE = '{"position": {{ position }}}'
 
 
 class SQLModelValidation(SQLModel):
     """
     Helper class to allow for validation in SQLModel classes with table=True
+
+    SQLModel table models only run their validators through validate_assignment, so it is what
+    validates devices on construction. Rows loaded by the ORM are hydrated without attribute
+    assignment and therefore skip validation on the read path.
     """
 
     model_config = {"from_attributes": True, "validate_assignment": True}
@@ -22,14 +28,14 @@ class CurtainSkillDevice(SQLModelValidation, table=True):
     room: str
     payload_open: str = '{"state": "OPEN"}'
     payload_close: str = '{"state": "CLOSE"}'
-    payload_set_template: str = '{"position": {{ position }}}'
+    payload_set_template: str = DEFAULT_PAYLOAD_SET_TEMPLATE
 
     # Validate the topic field to ensure it conforms to MQTT standards
     @field_validator("topic")
     @classmethod
     def validate_topic(cls, value: str):
         # Check for any invalid characters in the topic
-        if MQTT_TOPIC_REGEX.findall(value):
+        if MQTT_TOPIC_REGEX.search(value) is not None:
             raise ValueError("Topic must not contain '+', '#', whitespace, or control characters.")
         if len(value) > 128:
             raise ValueError("Topic length exceeds maximum allowed limit (128 characters).")
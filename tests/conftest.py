@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from unittest.mock import Mock
+
+import jinja2
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel
+
+from private_assistant_curtain_skill import config
+from private_assistant_curtain_skill.curtain_skill import CurtainSkill
+from private_assistant_curtain_skill.models import CurtainSkillDevice
+
+# Built once at import, children are cleared before their parents
+DELETE_ALL_ROWS = tuple(table.delete() for table in reversed(SQLModel.metadata.sorted_tables))
+
+
+def pytest_collection_modifyitems(items):
+    # Run every async test on the session event loop so the engine and its connection are shared
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if pytest_asyncio.is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def engine_async():
+    # Set up an in-memory SQLite database once, tests only clear their rows afterwards
+    # StaticPool keeps the single connection that holds the in-memory database alive for all tests
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def db_engine(engine_async):
+    yield engine_async
+    # Delete all rows after each test to ensure a clean state without repeating the DDL
+    async with engine_async.begin() as conn:
+        for statement in DELETE_ALL_ROWS:
+            await conn.execute(statement)
+
+
+@pytest.fixture
+def insert_devices(db_engine):
+    async def insert_devices(*devices):
+        # Store all fixture devices with one executemany, the ORM unit of work is not needed for test rows
+        async with db_engine.begin() as conn:
+            await conn.execute(insert(CurtainSkillDevice), [device.model_dump() for device in devices])
+
+    return insert_devices
+
+
+class FakeMQTTClient:
+    """Records published messages in order and raises the exception registered for a topic."""
+
+    def __init__(self) -> None:
+        self.published: list[tuple[str, bytes, int]] = []
+        self.failures: dict[str, Exception] = {}
+
+    async def publish(self, topic: str, payload: bytes, qos: int = 0) -> None:
+        self.published.append((topic, payload, qos))
+        if topic in self.failures:
+            raise self.failures[topic]
+
+    def reset(self) -> None:
+        self.published.clear()
+        self.failures.clear()
+
+
+# Fake and mock components are created once per session, make_skill only resets their recorded calls
+@pytest.fixture(scope="session")
+def mqtt_client():
+    return FakeMQTTClient()
+
+
+@pytest.fixture(scope="session")
+def template_env():
+    # A real environment with short stand-in answers, Jinja compiles each template once per session
+    return jinja2.Environment(
+        loader=jinja2.DictLoader(
+            {
+                "help.j2": "Help text",
+                "state.j2": "Curtains {{ action.value }}",
+                "set_curtain.j2": "Curtains set to {{ parameters.position }}",
+            }
+        )
+    )
+
+
+@pytest.fixture(scope="session")
+def mock_task_group():
+    # create_task is synchronous, an AsyncMock would hand back coroutines that are never awaited
+    return Mock(spec=asyncio.TaskGroup)
+
+
+@pytest.fixture(scope="session")
+def mock_logger():
+    return Mock(logging.Logger)
+
+
+@pytest.fixture
+def make_skill(db_engine, mqtt_client, template_env, mock_task_group, mock_logger):
+    mqtt_client.reset()
+    for mock in (mock_task_group, mock_logger):
+        mock.reset_mock(return_value=True, side_effect=True)
+
+    def make_skill(config_obj=None, **kwargs):
+        # Create an instance of CurtainSkill using the in-memory DB and mocked dependencies
+        return CurtainSkill(
+            config_obj=config_obj or config.CurtainSkillConfig(),
+            mqtt_client=mqtt_client,
+            db_engine=db_engine,
+            template_env=template_env,
+            task_group=mock_task_group,
+            logger=mock_logger,
+            **kwargs,
+        )
+
+    return make_skill
+
+
+@pytest.fixture
+def skill(make_skill):
+    return make_skill()
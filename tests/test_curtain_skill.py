@@ -1,212 +1,422 @@
-import logging
-import unittest
+import asyncio
+from dataclasses import dataclass
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, Mock, patch
 
 import jinja2
-from private_assistant_commons import messages
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlmodel import SQLModel
-
-from private_assistant_curtain_skill import models
-from private_assistant_curtain_skill.curtain_skill import Action, CurtainSkill, Parameters
-
-
-class TestCurtainSkill(unittest.IsolatedAsyncioTestCase):
-    @classmethod
-    def setUpClass(cls):
-        # Set up an in-memory SQLite database for async usage
-        cls.engine_async = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
-
-    async def asyncSetUp(self):
-        # Create tables asynchronously before each test
-        async with self.engine_async.begin() as conn:
-            await conn.run_sync(SQLModel.metadata.create_all)
-
-        # Create mock components for testing
-        self.mock_mqtt_client = AsyncMock()
-        self.mock_config = Mock()
-        self.mock_template_env = Mock(spec=jinja2.Environment)
-        self.mock_task_group = AsyncMock()
-        self.mock_logger = Mock(logging.Logger)
-
-        # Create an instance of CurtainSkill using the in-memory DB and mocked dependencies
-        self.skill = CurtainSkill(
-            config_obj=self.mock_config,
-            mqtt_client=self.mock_mqtt_client,
-            db_engine=self.engine_async,
-            template_env=self.mock_template_env,
-            task_group=self.mock_task_group,
-            logger=self.mock_logger,
-        )
-
-    async def asyncTearDown(self):
-        # Drop tables asynchronously after each test to ensure a clean state
-        async with self.engine_async.begin() as conn:
-            await conn.run_sync(SQLModel.metadata.drop_all)
-
-    async def test_get_devices(self):
-        # Insert mock devices into the in-memory SQLite database
-        mock_device_1 = models.CurtainSkillDevice(
-            id=1,
-            topic="livingroom/curtain/main",
-            alias="main curtain",
-            room="living room",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-        mock_device_2 = models.CurtainSkillDevice(
-            id=2,
-            topic="bedroom/curtain/main",
-            alias="main curtain",
-            room="bedroom",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-        mock_device_3 = models.CurtainSkillDevice(
-            id=3,
-            topic="kitchen/curtain/main",
-            alias="main curtain",
-            room="kitchen",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-        async with AsyncSession(self.engine_async) as session, session.begin():
-            session.add_all([mock_device_1, mock_device_2, mock_device_3])
-
-        devices = await self.skill.get_devices(["living room"])
-
-        # Assert that the correct device is returned
-        self.assertEqual(len(devices), 1)
-        self.assertEqual(devices[0].alias, "main curtain")
-        self.assertEqual(devices[0].topic, "livingroom/curtain/main")
-
-        devices = await self.skill.get_devices(["living room", "bedroom"])
-
-        # Assert that the correct device is returned
-        self.assertEqual(len(devices), 2)
-        self.assertEqual(devices[0].alias, "main curtain")
-        self.assertEqual(devices[0].topic, "livingroom/curtain/main")
-        self.assertEqual(devices[1].alias, "main curtain")
-        self.assertEqual(devices[1].topic, "bedroom/curtain/main")
-
-    async def test_find_parameters(self):
-        # Insert mock devices into the in-memory SQLite database
-        mock_device_1 = models.CurtainSkillDevice(
-            topic="livingroom/curtain/main",
-            alias="main curtain",
-            room="living room",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-        mock_device_2 = models.CurtainSkillDevice(
-            topic="livingroom/curtain/side",
-            alias="side curtain",
-            room="living room",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-        mock_device_3 = models.CurtainSkillDevice(
-            id=3,
-            topic="kitchen/curtain/main",
-            alias="main curtain",
-            room="kitchen",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-
-        async with AsyncSession(self.engine_async) as session, session.begin():
-            session.add_all([mock_device_1, mock_device_2, mock_device_3])
-
-        mock_intent_result = Mock(spec=messages.IntentAnalysisResult)
-        mock_client_request = Mock(spec=messages.ClientRequest)
-        mock_client_request.room = "living room"
-        mock_intent_result.rooms = []
-        mock_intent_result.client_request = mock_client_request
-        mock_intent_result.nouns = ["curtain"]
-        mock_intent_result.numbers = [Mock(number_token=50)]
-
-        parameters = await self.skill.find_parameters(Action.SET, mock_intent_result)
-
-        # Assert that all devices in the room are included in the parameters
-        self.assertEqual(len(parameters.targets), 2)
-        self.assertEqual(parameters.targets[0].alias, "main curtain")
-        self.assertEqual(parameters.targets[1].alias, "side curtain")
-        self.assertEqual(parameters.position, 50)
-
-    async def test_calculate_certainty_with_curtain(self):
-        mock_intent_result = Mock(spec=messages.IntentAnalysisResult)
-        mock_intent_result.nouns = ["curtain"]
-        certainty = await self.skill.calculate_certainty(mock_intent_result)
-        self.assertEqual(certainty, 1.0)
-
-    async def test_calculate_certainty_without_curtain(self):
-        mock_intent_result = Mock(spec=messages.IntentAnalysisResult)
-        mock_intent_result.nouns = ["blind"]
-        certainty = await self.skill.calculate_certainty(mock_intent_result)
-        self.assertEqual(certainty, 0)
-
-    async def test_send_mqtt_command(self):
-        # Create mock device
-        mock_device = models.CurtainSkillDevice(
-            id=1,
-            topic="livingroom/curtain/main",
-            alias="main curtain",
-            room="living room",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-
-        parameters = Parameters(targets=[mock_device], position=75)
-
-        # Call the async method to send the MQTT command
-        await self.skill.send_mqtt_command(Action.SET, parameters)
-
-        # Assert that the MQTT client sent the correct payload
-        self.mock_mqtt_client.publish.assert_called_once_with("livingroom/curtain/main", '{"position": 75}', qos=1)
-        self.mock_logger.info.assert_called_with(
-            "Sending payload %s to topic %s via MQTT.", '{"position": 75}', "livingroom/curtain/main"
-        )
-
-    async def test_process_request_with_set_action(self):
-        mock_device = models.CurtainSkillDevice(
-            id=1,
-            topic="livingroom/curtain/main",
-            alias="curtain",
-            room="living room",
-            payload_open='{"state": "OPEN"}',
-            payload_close='{"state": "CLOSE"}',
-            payload_set_template='{"position": {{ position }}}',
-        )
-        mock_client_request = Mock()
-        mock_client_request.room = "living room"
-        mock_client_request.text = "set the curtain to 50%"
-
-        mock_intent_result = Mock(spec=messages.IntentAnalysisResult)
-        mock_intent_result.client_request = mock_client_request
-        mock_intent_result.verbs = ["set"]
-        mock_intent_result.nouns = ["curtain"]
-        mock_intent_result.numbers = [Mock(number_token=50)]
-
-        mock_parameters = Parameters(targets=[mock_device], position=50)
-
-        with (
-            patch.object(self.skill, "get_answer", return_value="Setting curtain to 50%") as mock_get_answer,
-            patch.object(self.skill, "send_mqtt_command") as mock_send_mqtt_command,
-            patch.object(self.skill, "find_parameters", return_value=mock_parameters),
-            patch.object(self.skill, "send_response") as mock_send_response,
-        ):
-            await self.skill.process_request(mock_intent_result)
-
-            # Assert that methods were called with expected arguments
-            mock_get_answer.assert_called_once_with(Action.SET, mock_parameters)
-            mock_send_mqtt_command.assert_called_once_with(Action.SET, mock_parameters)
-            mock_send_response.assert_called_once_with(
-                "Setting curtain to 50%", client_request=mock_intent_result.client_request
-            )
+import pytest
+from sqlalchemy import update
+
+from private_assistant_curtain_skill import config, models
+from private_assistant_curtain_skill.curtain_skill import MISSING_POSITION_ANSWER, Action, Parameters
+
+# Device rows shared by the tests, payload fields keep their model defaults unless a test overrides them
+LIVING_ROOM_MAIN = {"topic": "livingroom/curtain/main", "alias": "main curtain", "room": "living room"}
+LIVING_ROOM_SIDE = {"topic": "livingroom/curtain/side", "alias": "side curtain", "room": "living room"}
+BEDROOM_MAIN = {"topic": "bedroom/curtain/main", "alias": "main curtain", "room": "bedroom"}
+KITCHEN_MAIN = {"topic": "kitchen/curtain/main", "alias": "main curtain", "room": "kitchen"}
+
+
+@dataclass(slots=True)
+class FakeClientRequest:
+    """Stands in for the client request fields the skill reads."""
+
+    room: str
+    text: str = ""
+
+
+def test_find_matching_action():
+    assert Action.find_matching_action(["please", "close"]) == Action.CLOSE
+    assert Action.find_matching_action(["dim"]) is None
+
+
+@pytest.mark.parametrize(
+    ("rooms", "expected_topics"),
+    [
+        (["living room"], ["livingroom/curtain/main"]),
+        (["living room", "bedroom"], ["livingroom/curtain/main", "bedroom/curtain/main"]),
+    ],
+)
+async def test_get_devices(insert_devices, skill, rooms, expected_topics):
+    # Insert mock devices into the in-memory SQLite database
+    mock_device_1 = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+    mock_device_2 = models.CurtainSkillDevice(**BEDROOM_MAIN, id=2)
+    mock_device_3 = models.CurtainSkillDevice(**KITCHEN_MAIN, id=3)
+    await insert_devices(mock_device_1, mock_device_2, mock_device_3)
+
+    devices = await skill.get_devices(rooms)
+
+    # Assert that the devices of the requested rooms are returned in room order
+    assert [device.topic for device in devices] == expected_topics
+    assert all(device.alias == "main curtain" for device in devices)
+
+
+async def test_get_devices_without_stored_devices_loads_once(skill):
+    with patch.object(skill, "load_device_cache", wraps=skill.load_device_cache) as mock_load:
+        assert await skill.get_devices(["living room"]) == []
+        assert await skill.get_devices(["living room"]) == []
+
+    # Assert that an empty device table does not trigger a database query per request
+    mock_load.assert_awaited_once()
+
+
+async def test_get_devices_reloads_expired_cache(insert_devices, make_skill):
+    skill = make_skill(config.CurtainSkillConfig(device_cache_ttl=0))
+    assert await skill.get_devices(["living room"]) == []
+
+    await insert_devices(models.CurtainSkillDevice(**LIVING_ROOM_MAIN))
+    devices = await skill.get_devices(["living room"])
+
+    # Assert that devices added after the first load are picked up once the cache expired
+    assert len(devices) == 1
+    assert devices[0].topic == "livingroom/curtain/main"
+
+
+async def test_get_devices_reloads_empty_cache(insert_devices, make_skill):
+    skill = make_skill(config.CurtainSkillConfig(empty_device_cache_ttl=0))
+    assert await skill.get_devices(["living room"]) == []
+
+    await insert_devices(models.CurtainSkillDevice(**LIVING_ROOM_MAIN))
+
+    # Assert that curtains added after an empty startup are picked up even though the full cache never expires
+    assert len(await skill.get_devices(["living room"])) == 1
+
+
+async def test_get_devices_shares_one_reload_between_concurrent_requests(insert_devices, make_skill, mock_logger):
+    skill = make_skill(config.CurtainSkillConfig(device_cache_ttl=60))
+    await insert_devices(models.CurtainSkillDevice(**LIVING_ROOM_MAIN))
+
+    results = await asyncio.gather(*(skill.get_devices(["living room"]) for _ in range(3)))
+
+    # Assert that requests arriving while the cache loads wait for it instead of querying the database again
+    assert [len(devices) for devices in results] == [1, 1, 1]
+    loads = [
+        call
+        for call in mock_logger.debug.call_args_list
+        if call.args == ("Loading devices into cache asynchronously.",)
+    ]
+    assert len(loads) == 1
+
+
+async def test_skill_preparations_loads_device_cache(insert_devices, skill):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN)
+    await insert_devices(mock_device)
+
+    await skill.skill_preparations()
+
+    # Assert that the devices are available before any request is processed
+    with patch.object(skill, "load_device_cache") as mock_load:
+        devices = await skill.get_devices(["living room"])
+    mock_load.assert_not_called()
+    assert len(devices) == 1
+
+
+async def test_skill_preparations_sets_ready(make_skill):
+    ready = asyncio.Event()
+    skill = make_skill(ready=ready)
+    assert not ready.is_set()
+
+    await skill.skill_preparations()
+
+    # Assert that waiting callers are released once the skill can take requests
+    assert ready.is_set()
+
+
+async def test_skill_preparations_survives_failed_device_cache_load(insert_devices, make_skill, mock_logger):
+    ready = asyncio.Event()
+    skill = make_skill(ready=ready)
+    with patch.object(skill, "load_device_cache", side_effect=OSError("database unreachable")):
+        await skill.skill_preparations()
+
+    # Assert that the skill still becomes ready and the first request loads the cache
+    assert ready.is_set()
+    mock_logger.error.assert_called_once()
+    await insert_devices(models.CurtainSkillDevice(**LIVING_ROOM_MAIN))
+    assert len(await skill.get_devices(["living room"])) == 1
+
+
+@pytest.mark.parametrize(
+    ("action", "rooms", "numbers", "expected_rooms", "expected_topics", "expected_position"),
+    [
+        # Without a room in the request the client's room is used
+        (Action.SET, [], [50], ["living room"], ["livingroom/curtain/main", "livingroom/curtain/side"], 50),
+        (Action.SET, ["kitchen"], [30], ["kitchen"], ["kitchen/curtain/main"], 30),
+        (Action.SET, [], [], ["living room"], ["livingroom/curtain/main", "livingroom/curtain/side"], None),
+        # Untargeted actions neither collect devices nor a position
+        (Action.HELP, [], [50], ["living room"], [], None),
+    ],
+)
+async def test_find_parameters(
+    insert_devices, skill, action, rooms, numbers, expected_rooms, expected_topics, expected_position
+):
+    # Insert mock devices into the in-memory SQLite database
+    mock_device_1 = models.CurtainSkillDevice(**LIVING_ROOM_MAIN)
+    mock_device_2 = models.CurtainSkillDevice(**LIVING_ROOM_SIDE)
+    mock_device_3 = models.CurtainSkillDevice(**KITCHEN_MAIN, id=3)
+
+    await insert_devices(mock_device_1, mock_device_2, mock_device_3)
+
+    mock_intent_result = SimpleNamespace(
+        rooms=rooms,
+        client_request=FakeClientRequest(room="living room"),
+        nouns=["curtain"],
+        numbers=[SimpleNamespace(number_token=number) for number in numbers],
+    )
+
+    parameters = await skill.find_parameters(action, mock_intent_result)
+
+    # Assert that the rooms, their devices and the position are taken from the request
+    assert parameters.rooms == expected_rooms
+    assert [device.topic for device in parameters.targets] == expected_topics
+    assert parameters.position == expected_position
+
+
+@pytest.mark.parametrize(
+    ("nouns", "expected_certainty"),
+    [
+        (["curtain"], 1.0),
+        (["Curtains"], 1.0),
+        (["blind"], 0),
+    ],
+)
+async def test_calculate_certainty(skill, nouns, expected_certainty):
+    mock_intent_result = SimpleNamespace(nouns=nouns)
+    certainty = await skill.calculate_certainty(mock_intent_result)
+    assert certainty == expected_certainty
+
+
+def test_get_answer_renders_action_template(skill):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN)
+
+    answer = skill.get_answer(Action.SET, Parameters(targets=[mock_device], position=50))
+
+    # Assert that the answer comes from the template loaded for the action
+    assert answer == "Curtains set to 50"
+
+
+def test_get_answer_reuses_rendered_answer(skill):
+    mock_template = Mock(spec=jinja2.Template)
+    mock_template.render.return_value = "The curtains in the room living room have been opened."
+    skill.action_to_answer[Action.OPEN] = mock_template
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN)
+
+    first_answer = skill.get_answer(Action.OPEN, Parameters(targets=[mock_device], rooms=["living room"]))
+    second_answer = skill.get_answer(Action.OPEN, Parameters(targets=[mock_device], rooms=["living room"]))
+
+    # Assert that an identical request is answered without rendering the template again
+    assert first_answer == second_answer
+    mock_template.render.assert_called_once()
+
+
+async def test_send_mqtt_command(skill, mqtt_client, mock_logger):
+    # Create mock device
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+
+    parameters = Parameters(targets=[mock_device], position=75)
+
+    # Call the async method to send the MQTT command
+    await skill.send_mqtt_command(Action.SET, parameters)
+
+    # Assert that the MQTT client sent the correct payload
+    assert mqtt_client.published == [("livingroom/curtain/main", b'{"position": 75}', 1)]
+    mock_logger.debug.assert_called_with(
+        "Sending payload %s to topic %s via MQTT.", b'{"position": 75}', "livingroom/curtain/main"
+    )
+
+
+async def test_send_mqtt_command_uses_configured_qos(make_skill, mqtt_client):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+    skill = make_skill(config.CurtainSkillConfig(command_qos={"close": 2}))
+
+    await skill.send_mqtt_command(Action.CLOSE, Parameters(targets=[mock_device]))
+    await skill.send_mqtt_command(Action.OPEN, Parameters(targets=[mock_device]))
+
+    # Assert that a partial override keeps the default QoS of the other commands
+    assert mqtt_client.published == [
+        ("livingroom/curtain/main", b'{"state": "CLOSE"}', 2),
+        ("livingroom/curtain/main", b'{"state": "OPEN"}', 0),
+    ]
+
+
+async def test_send_mqtt_command_without_payload_publishes_nothing(skill, mqtt_client, mock_logger):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+
+    await skill.send_mqtt_command(Action.HELP, Parameters(targets=[mock_device]))
+
+    # Assert that an action without a device payload is logged instead of raising
+    assert mqtt_client.published == []
+    mock_logger.error.assert_called_once_with("Unknown action: %s", Action.HELP)
+
+
+async def test_send_mqtt_command_continues_after_failed_publish(skill, mqtt_client, mock_logger):
+    mock_device_1 = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+    mock_device_2 = models.CurtainSkillDevice(**LIVING_ROOM_SIDE, id=2)
+    mqtt_client.failures["livingroom/curtain/main"] = ConnectionError("broker gone")
+
+    parameters = Parameters(targets=[mock_device_1, mock_device_2])
+    await skill.send_mqtt_command(Action.OPEN, parameters)
+
+    # Assert that the failing device does not prevent the other device from being addressed
+    assert mqtt_client.published == [
+        ("livingroom/curtain/main", b'{"state": "OPEN"}', 0),
+        ("livingroom/curtain/side", b'{"state": "OPEN"}', 0),
+    ]
+    mock_logger.error.assert_called_once()
+
+
+async def test_send_mqtt_command_publishes_once_per_group_topic(skill, mqtt_client):
+    mock_device_1 = models.CurtainSkillDevice(
+        id=1,
+        topic="livingroom/curtain/group",
+        alias="main curtain",
+        room="living room",
+    )
+    mock_device_2 = models.CurtainSkillDevice(
+        id=2,
+        topic="livingroom/curtain/group",
+        alias="side curtain",
+        room="living room",
+    )
+
+    parameters = Parameters(targets=[mock_device_1, mock_device_2], position=40)
+    await skill.send_mqtt_command(Action.SET, parameters)
+
+    # Assert that both curtains are addressed with a single message on their shared topic
+    assert mqtt_client.published == [("livingroom/curtain/group", b'{"position": 40}', 1)]
+
+
+async def test_send_mqtt_command_renders_shared_set_payload_once(skill, mqtt_client):
+    mock_device_1 = models.CurtainSkillDevice(
+        **LIVING_ROOM_MAIN, id=1, payload_set_template='{"position": {{ position }}, "transition": 2}'
+    )
+    mock_device_2 = models.CurtainSkillDevice(
+        **LIVING_ROOM_SIDE, id=2, payload_set_template='{"position": {{ position }}, "transition": 2}'
+    )
+
+    with patch.object(skill, "get_payload_set_template", wraps=skill.get_payload_set_template) as mock_get_template:
+        await skill.send_mqtt_command(Action.SET, Parameters(targets=[mock_device_1, mock_device_2], position=20))
+
+    # Assert that the shared template is rendered once and its payload is sent to both devices
+    mock_get_template.assert_called_once()
+    assert mqtt_client.published == [
+        ("livingroom/curtain/main", b'{"position": 20, "transition": 2}', 1),
+        ("livingroom/curtain/side", b'{"position": 20, "transition": 2}', 1),
+    ]
+
+
+async def test_send_mqtt_command_formats_default_set_payload_without_jinja(skill, mqtt_client):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+
+    with patch.object(skill, "get_payload_set_template") as mock_get_template:
+        await skill.send_mqtt_command(Action.SET, Parameters(targets=[mock_device], position=75))
+
+    # Assert that the default template is formatted directly and matches what Jinja would render
+    mock_get_template.assert_not_called()
+    expected_payload = jinja2.Template(models.DEFAULT_PAYLOAD_SET_TEMPLATE).render(position=75).encode()
+    assert mqtt_client.published == [("livingroom/curtain/main", expected_payload, 1)]
+
+
+async def test_invalid_payload_set_template_only_fails_set_on_its_device(insert_devices, skill, mqtt_client):
+    await insert_devices(
+        models.CurtainSkillDevice(**LIVING_ROOM_MAIN, payload_set_template='{"p": {{ position }'),
+        models.CurtainSkillDevice(**LIVING_ROOM_SIDE, payload_set_template='{"p": {{ position }}}'),
+    )
+    devices = await skill.get_devices(["living room"])
+
+    await skill.send_mqtt_command(Action.OPEN, Parameters(targets=devices))
+    await skill.send_mqtt_command(Action.SET, Parameters(targets=devices, position=40))
+
+    # Assert that a broken template neither breaks the cache load nor the commands of other devices
+    assert mqtt_client.published == [
+        ("livingroom/curtain/main", b'{"state": "OPEN"}', 0),
+        ("livingroom/curtain/side", b'{"state": "OPEN"}', 0),
+        ("livingroom/curtain/side", b'{"p": 40}', 1),
+    ]
+
+
+def test_payload_set_template_compiled_once(skill):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+
+    first_template = skill.get_payload_set_template(mock_device)
+    second_template = skill.get_payload_set_template(mock_device)
+
+    # Assert that the template is only compiled once and then reused
+    assert first_template is second_template
+    assert first_template.render(position=30) == '{"position": 30}'
+
+
+async def test_static_payloads_encoded_once(insert_devices, skill):
+    await insert_devices(models.CurtainSkillDevice(**LIVING_ROOM_MAIN, payload_open="OPEN", payload_close="CLOSE"))
+    (device,) = await skill.get_devices(["living room"])
+
+    payloads = skill.get_static_payloads(device)
+
+    # Assert that the payloads are encoded once per device while loading the cache and reused afterwards
+    assert payloads == {Action.OPEN: b"OPEN", Action.CLOSE: b"CLOSE"}
+    assert skill.get_static_payloads(device) is payloads
+
+
+async def test_send_mqtt_command_during_reload_keeps_reloaded_payloads(insert_devices, db_engine, make_skill):
+    skill = make_skill(config.CurtainSkillConfig(device_cache_ttl=0))
+    await insert_devices(models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1, payload_open="OLD"))
+    old_devices = await skill.get_devices(["living room"])
+    async with db_engine.begin() as conn:
+        await conn.execute(update(models.CurtainSkillDevice).values(payload_open="NEW"))
+
+    await asyncio.gather(
+        skill.load_device_cache(), skill.send_mqtt_command(Action.OPEN, Parameters(targets=old_devices))
+    )
+
+    # Assert that a command on devices from before the reload does not put their payloads into the new cache
+    (device,) = skill._device_cache["living room"]
+    assert skill.get_static_payloads(device)[Action.OPEN] == b"NEW"
+
+
+async def test_process_request_with_set_action(skill):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+    mock_client_request = FakeClientRequest(room="living room", text="set the curtain to 50%")
+
+    mock_intent_result = SimpleNamespace(
+        client_request=mock_client_request,
+        verbs=["set"],
+        nouns=["curtain"],
+        numbers=[SimpleNamespace(number_token=50)],
+    )
+
+    mock_parameters = Parameters(targets=[mock_device], position=50)
+
+    # The skill is built per test, so its methods are replaced without restoring them afterwards
+    skill.get_answer = mock_get_answer = Mock(return_value="Setting curtain to 50%")
+    skill.send_mqtt_command = mock_send_mqtt_command = Mock()
+    skill.find_parameters = AsyncMock(return_value=mock_parameters)
+    skill.send_response = mock_send_response = Mock()
+
+    await skill.process_request(mock_intent_result)
+
+    # Assert that methods were called with expected arguments
+    mock_get_answer.assert_called_once_with(Action.SET, mock_parameters)
+    mock_send_mqtt_command.assert_called_once_with(Action.SET, mock_parameters)
+    mock_send_response.assert_called_once_with(
+        "Setting curtain to 50%", client_request=mock_intent_result.client_request
+    )
+
+
+async def test_process_request_with_set_action_without_position(skill):
+    mock_device = models.CurtainSkillDevice(**LIVING_ROOM_MAIN, id=1)
+    mock_intent_result = SimpleNamespace(
+        client_request=FakeClientRequest(room="living room", text="set the curtain"), verbs=["set"], numbers=[]
+    )
+
+    mock_parameters = Parameters(targets=[mock_device])
+
+    skill.send_mqtt_command = mock_send_mqtt_command = Mock()
+    skill.find_parameters = AsyncMock(return_value=mock_parameters)
+    skill.send_response = mock_send_response = Mock()
+
+    await skill.process_request(mock_intent_result)
+
+    # Assert that a missing position is not treated as position 0 and the user is told about it
+    mock_send_mqtt_command.assert_not_called()
+    mock_send_response.assert_called_once_with(
+        MISSING_POSITION_ANSWER, client_request=mock_intent_result.client_request
+    )
@@ -1,23 +1,43 @@
-import jinja2
 import pytest
 
+from private_assistant_curtain_skill import main
 from private_assistant_curtain_skill.curtain_skill import Action, Parameters
 from private_assistant_curtain_skill.models import CurtainSkillDevice
 
+# Devices shared by the parametrized cases, the templates only check whether targets exist
+LIVING_ROOM_CURTAIN = CurtainSkillDevice(
+    topic="livingroom/curtain/main", alias="Living Room Curtain", room="Living Room"
+)
+BEDROOM_CURTAIN = CurtainSkillDevice(topic="bedroom/curtain/main", alias="Bedroom Curtain", room="Bedroom")
 
-# Fixture to set up the Jinja2 environment
-@pytest.fixture(scope="module")
-def jinja_env():
-    return jinja2.Environment(
-        loader=jinja2.PackageLoader(
-            "private_assistant_curtain_skill",
-            "templates",
-        ),
-    )
+
+# Fixture to set up the Jinja2 environment the skill uses, with its bytecode cache in a temporary directory
+@pytest.fixture(scope="session")
+def jinja_env(tmp_path_factory):
+    return main.make_template_env(tmp_path_factory.mktemp("jinja_bytecode"))
+
+
+def test_template_env_without_cache_dir_has_no_bytecode_cache():
+    # Assert that no bytecode is written to a temporary directory the container would discard
+    assert main.make_template_env().bytecode_cache is None
+
+
+def test_template_env_creates_missing_cache_dir(tmp_path):
+    cache_dir = tmp_path / "does" / "not" / "exist"
+
+    main.make_template_env(cache_dir).get_template("help.j2")
+
+    # Assert that the compiled template was written to the newly created directory
+    assert any(cache_dir.iterdir())
+
+
+# Templates are looked up once per session and shared by all parametrized cases
+@pytest.fixture(scope="session")
+def templates(jinja_env):
+    return {name: jinja_env.get_template(name) for name in ("help.j2", "state.j2", "set_curtain.j2")}
 
 
-def render_template(template_name, parameters, env, action=None):
-    template = env.get_template(template_name)
+def render_template(template, parameters, action=None):
     return template.render(parameters=parameters, action=action)
 
 
@@ -27,28 +47,28 @@ def render_template(template_name, parameters, env, action=None):
     [
         (
             Action.OPEN,
-            [CurtainSkillDevice(alias="Living Room Curtain")],
+            [LIVING_ROOM_CURTAIN],
             ["Living Room"],
             "The curtains in the room Living Room have been opened.\n",
         ),
         (
             Action.CLOSE,
-            [CurtainSkillDevice(alias="Bedroom Curtain")],
+            [BEDROOM_CURTAIN],
             ["Bedroom"],
             "The curtains in the room Bedroom have been closed.\n",
         ),
         (
             Action.CLOSE,
-            [CurtainSkillDevice(alias="Bedroom Curtain")],
+            [BEDROOM_CURTAIN],
             ["Bedroom", "Living Room"],
             "The curtains in the rooms Bedroom and Living Room have been closed.\n",
         ),
         (Action.OPEN, [], ["Bedroom"], "No curtains were found for the specified room.\n"),
     ],
 )
-def test_state_template(jinja_env, action, targets, rooms, expected_output):
+def test_state_template(templates, action, targets, rooms, expected_output):
     parameters = Parameters(targets=targets, rooms=rooms)
-    result = render_template("state.j2", parameters, jinja_env, action=action)
+    result = render_template(templates["state.j2"], parameters, action=action)
     assert result == expected_output
 
 
@@ -57,20 +77,20 @@ def test_state_template(jinja_env, action, targets, rooms, expected_output):
     "targets, position, rooms, expected_output",
     [
         (
-            [CurtainSkillDevice(alias="Living Room Curtain")],
+            [LIVING_ROOM_CURTAIN],
             50,
             ["Living Room"],
             "The curtains in the room Living Room have been set to 50%.",
         ),
         (
-            [CurtainSkillDevice(alias="Bedroom Curtain")],
+            [BEDROOM_CURTAIN],
             75,
             ["Bedroom", "Living Room"],
             "The curtains in the rooms Bedroom and Living Room have been set to 75%.",
         ),
     ],
 )
-def test_set_curtain_template(jinja_env, targets, position, rooms, expected_output):
+def test_set_curtain_template(templates, targets, position, rooms, expected_output):
     parameters = Parameters(targets=targets, position=position, rooms=rooms)
-    result = render_template("set_curtain.j2", parameters, jinja_env)
+    result = render_template(templates["set_curtain.j2"], parameters)
     assert result == expected_output